@@ -17,8 +17,9 @@ from uuid import uuid4
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from app.utils.stt import transcribe_audio
+from app.utils.stt import transcribe_audio_async
 from app.utils.llm import ask_llm
+from app.utils.concurrency import governor, Priority, Saturated
 from app.utils.tts import speak_text_stream
 
 app = FastAPI()
@@ -37,9 +38,37 @@ app.add_middleware(
 from fastapi import UploadFile
 from pydub import AudioSegment
 
+
+def busy_response(e: Saturated):
+    return JSONResponse(
+        content={"error": str(e), "busy": True, "retryAfter": round(e.retry_after)},
+        status_code=503,
+        headers={"Retry-After": str(round(e.retry_after))},
+    )
+
+
+async def speak_or_skip(text, budget):
+    """
+    TTS for a turn whose LLM step already ran (and may have changed the
+    order). Saturation must not make the client repeat the turn, so the
+    reply is sent without audio instead.
+    """
+    try:
+        return await speak_text_stream(text, budget=budget), False
+    except Saturated as e:
+        logger.warning(f"Sending reply without audio: {e}")
+        return "", True
+
+
 @app.post("/api/audio")
-async def handle_audio(file: UploadFile):
+async def handle_audio(file: UploadFile, order_id: str = None):
+    """
+    One-shot voice turn. Pass the returned orderId back as `order_id` to
+    keep adding to the same order.
+    """
     logger.info(f"Received file: {file.filename}, content_type: {file.content_type}")
+    order_id = order_id or str(uuid4())[:4]
+    tmp_path = wav_path = None
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
             contents = await file.read()
@@ -51,18 +80,33 @@ async def handle_audio(file: UploadFile):
         audio_segment.export(wav_path, format="wav")
 
         audio, sr = sf.read(wav_path)
-        transcript = transcribe_audio(audio, sr)
-        response = await ask_llm(transcript)
-        audio_b64 = await speak_text_stream(response)
-
-        os.remove(tmp_path)
-        os.remove(wav_path)
-
-        return { "transcript": transcript, "response": response, "audio": audio_b64 }
+        budget = governor.turn_budget()
+        transcript = await transcribe_audio_async(audio, sr, budget=budget)
+        llm_result = await ask_llm(transcript, order_id=order_id, budget=budget)
+        response = llm_result["text"]
+        audio_b64, tts_skipped = await speak_or_skip(response, budget)
+
+        return {
+            "orderId": order_id,
+            "transcript": transcript,
+            "response": response,
+            "audio": audio_b64,
+            "ttsSkipped": tts_skipped,
+            "order": llm_result["order"]
+        }
 
+    except Saturated as e:
+        logger.warning(f"Rejecting /api/audio: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Audio processing failed: {e}", exc_info=True)
         return JSONResponse(content={"error": str(e)}, status_code=400)
+    finally:
+        for path in (tmp_path, wav_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
 @app.post("/api/start_conversation")
 async def start_conversation():
     """
@@ -78,7 +122,7 @@ async def start_conversation():
         # logger.info(f"LLM generated greeting: {initial_greeting}")
 
         # Generate audio for the greeting
-        audio_base64 = await speak_text_stream(initial_greeting)
+        audio_base64 = await speak_text_stream(initial_greeting, priority=Priority.GREETING)
         logger.info(f"Generated audio for greeting, base64 length: {len(audio_base64)}")
 
         if not audio_base64:
@@ -89,6 +133,9 @@ async def start_conversation():
         # and the audio data (as 'audio')
         return {"transcript": initial_greeting, "response": initial_greeting, "audio": audio_base64} # Send text as both for now
 
+    except Saturated as e:
+        logger.warning(f"Rejecting /api/start_conversation: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error in /api/start_conversation: {e}", exc_info=True)
         return JSONResponse(content={"error": "Internal server error starting conversation"}, status_code=500)
@@ -104,46 +151,86 @@ async def signed_url(agent_id: str):
         return JSONResponse(content={"error": "Failed to generate signed URL"}, status_code=500)
 
 
+@app.get("/api/capacity")
+async def capacity():
+    """
+    Live admission stats: active/queued sessions and per-upstream load.
+    """
+    return governor.stats()
+
+
 
 
 
 @app.websocket("/ws/converse")
 async def converse_websocket(websocket: WebSocket):
     await websocket.accept()
+
+    async def report_position(position):
+        await websocket.send_json({"queued": True, "position": position})
+
+    try:
+        admitted_at = await governor.sessions.acquire(on_wait=report_position)
+    except Saturated as e:
+        logger.warning(f"Rejecting new session: {e}")
+        await websocket.send_json({"error": str(e), "busy": True, "retryAfter": round(e.retry_after)})
+        await websocket.close(code=1013)  # Try Again Later
+        return
+    except WebSocketDisconnect:
+        logger.info("WebSocket disconnected while queued")
+        return
+
     order_id = str(uuid4())[:4]
     logger.info(f"New session started with order_id: {order_id}")
 
-    initial_greeting = "Hello! Welcome to our restaurant. How can I help you order today?"
-    audio_base64 = await speak_text_stream(initial_greeting)
-    await websocket.send_json({
-        "orderId": order_id,
-        "transcript": initial_greeting,
-        "response": initial_greeting,
-        "audio": audio_base64,
-        "order": {
-            "items": [],
-            "total": 0.0
-        }
-    })
-
     try:
+        initial_greeting = "Hello! Welcome to our restaurant. How can I help you order today?"
+        try:
+            audio_base64 = await speak_text_stream(initial_greeting, priority=Priority.GREETING)
+        except Saturated as e:
+            logger.warning(f"Dropping session {order_id} before greeting: {e}")
+            await websocket.send_json({"error": str(e), "busy": True, "retryAfter": round(e.retry_after)})
+            await websocket.close(code=1013)
+            return
+
+        await websocket.send_json({
+            "orderId": order_id,
+            "transcript": initial_greeting,
+            "response": initial_greeting,
+            "audio": audio_base64,
+            "order": {
+                "items": [],
+                "total": 0.0
+            }
+        })
+
         while True:
             data = await websocket.receive_bytes()
             with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
                 tmp.write(data)
                 tmp_path = tmp.name
 
-            audio, sr = sf.read(tmp_path)
-            transcript = transcribe_audio(audio, sr)
-            if not transcript:
-                await websocket.send_json({"error": "Transcription failed"})
+            budget = governor.turn_budget()
+            try:
+                audio, sr = sf.read(tmp_path)
+                transcript = await transcribe_audio_async(audio, sr, budget=budget)
+                if not transcript:
+                    await websocket.send_json({"error": "Transcription failed"})
+                    continue
+
+                # ask_llm only raises Saturated before any tool has changed
+                # the order, so a retry is safe
+                llm_result = await ask_llm(transcript, order_id=order_id, budget=budget)
+            except Saturated as e:
+                logger.warning(f"Turn rejected for order_id {order_id}: {e}")
+                await websocket.send_json({"error": str(e), "busy": True, "retryAfter": round(e.retry_after)})
                 continue
+            finally:
+                os.remove(tmp_path)
 
-            llm_result = await ask_llm(transcript, order_id=order_id)
             llm_response = llm_result["text"]
             order_info = llm_result["order"]
-            audio_base64 = await speak_text_stream(llm_response)
-            os.remove(tmp_path)
+            audio_base64, tts_skipped = await speak_or_skip(llm_response, budget)
 
             await websocket.send_json({
                 "orderId": order_id,
@@ -151,11 +238,14 @@ async def converse_websocket(websocket: WebSocket):
                 "transcript": llm_response,
                 "response": llm_response,
                 "audio": audio_base64,
+                "ttsSkipped": tts_skipped,
                 "order": order_info
             })
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for order_id: {order_id}")
+    finally:
+        governor.sessions.release(admitted_at)
 
 
 from fastapi.responses import HTMLResponse
@@ -0,0 +1,387 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Settings below are read at import time, which can happen before the
+# modules that normally call this, so load .env here as well
+load_dotenv()
+
+# === Logger Setup ===
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# === Priorities (lower value is served first) ===
+class Priority:
+    TURN = 0        # a user is waiting on a reply inside an admitted session
+    GREETING = 1    # opening message of a brand new session
+
+
+class Saturated(Exception):
+    """Raised when a request cannot be admitted within its deadline."""
+
+    def __init__(self, resource: str, retry_after: float):
+        super().__init__(f"{resource} is at capacity, retry in {retry_after:.0f}s")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+def _env(name, default, cast):
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+def _env_int(name, default):
+    return _env(name, default, int)
+
+
+def _env_float(name, default):
+    return _env(name, default, float)
+
+
+# === Token Bucket ===
+class TokenBucket:
+    """
+    Async token bucket whose waiters are served by (priority, arrival order).
+    A rate of 0 disables rate limiting.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def take(self, priority=Priority.TURN, deadline=None):
+        """Take one token, or raise asyncio.TimeoutError if none is free by `deadline`."""
+        if self.rate <= 0:
+            return
+        key = (priority, next(self._seq))
+        async with self._changed:
+            heapq.heappush(self._waiters, key)
+            try:
+                while True:
+                    self._refill()
+                    is_head = self._waiters[0] == key
+                    if is_head and self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        self._changed.notify_all()
+                        return
+                    now = time.monotonic()
+                    # Only the head waits for a refill; everyone else waits
+                    # for the head to move
+                    wait = (1 - self._tokens) / self.rate if is_head else None
+                    if deadline is not None:
+                        if now + (wait or 0) > deadline:
+                            raise asyncio.TimeoutError()
+                        wait = deadline - now if wait is None else wait
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if key in self._waiters:
+                    self._waiters.remove(key)
+                    heapq.heapify(self._waiters)
+                    self._changed.notify_all()
+                raise
+
+    async def give_back(self):
+        """Return a token for a call that never went upstream."""
+        if self.rate <= 0:
+            return
+        # Refund before awaiting so the token survives a second cancellation
+        self._tokens = min(self.burst, self._tokens + 1)
+        async with self._changed:
+            # Wake the head, which may be sleeping until the next refill
+            self._changed.notify_all()
+
+    def stats(self):
+        if self.rate <= 0:
+            return {"rate_per_sec": 0, "burst": self.burst, "tokens": None, "waiting": 0}
+        self._refill()
+        return {"rate_per_sec": self.rate, "burst": self.burst, "tokens": round(self._tokens, 2), "waiting": self.waiting}
+
+
+# === Priority Limiter ===
+class PriorityLimiter:
+    """
+    Semaphore whose waiters are served by (priority, arrival order).
+    Slots are handed directly to the next waiter on release, so a newcomer
+    can never jump ahead of someone already queued.
+    """
+
+    def __init__(self, name: str, capacity: int, max_waiting: int, timeout: float, retry_floor: float = 1.0):
+        self.name = name
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.retry_floor = retry_floor
+        self.in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._admitted = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._released = 0
+        self._held_total = 0.0
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def position(self, fut):
+        """1-based queue position of a pending waiter, 0 once it has been served."""
+        live = sorted((w for w in self._waiters if not w[2].done()), key=lambda w: w[:2])
+        for idx, (_, _, f) in enumerate(live, start=1):
+            if f is fut:
+                return idx
+        return 0
+
+    def retry_after(self):
+        # A slot frees roughly every avg_hold / capacity seconds, so that is
+        # the pace at which the queue (plus the caller) drains
+        if not self._released:
+            return self.retry_floor
+        avg_hold = self._held_total / self._released
+        return max(self.retry_floor, avg_hold * (self.waiting + 1) / max(1, self.capacity))
+
+    def reject(self, retry_after=None):
+        """Count a rejection against this limiter and raise Saturated."""
+        self._rejected += 1
+        raise Saturated(self.name, self.retry_after() if retry_after is None else retry_after)
+
+    def _record_wait(self, started):
+        now = time.monotonic()
+        waited = now - started
+        self._admitted += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return now
+
+    async def acquire(self, priority=Priority.TURN, timeout=None, on_wait=None, update_interval=1.0, queued_since=None):
+        """
+        Take a slot or raise Saturated. `on_wait(position)` is awaited while
+        queued so callers can tell clients where they stand. Returns the
+        admission time, to be handed back to release().
+        """
+        started = time.monotonic() if queued_since is None else queued_since
+        if self.in_flight < self.capacity and not self.waiting:
+            self.in_flight += 1
+            return self._record_wait(started)
+        if self.waiting >= self.max_waiting:
+            self.reject()
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = started + timeout
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.reject()
+                if on_wait is not None:
+                    await on_wait(self.position(fut))
+                    if fut.done():
+                        break
+                    remaining = min(update_interval, deadline - time.monotonic())
+                done, _ = await asyncio.wait({fut}, timeout=remaining)
+                if done:
+                    break
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed to us while we were giving up, pass it on
+                self.release()
+            else:
+                fut.cancel()
+            raise
+        finally:
+            self._prune()
+        return self._record_wait(started)
+
+    def release(self, admitted_at=None):
+        if admitted_at is not None:
+            self._released += 1
+            self._held_total += time.monotonic() - admitted_at
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def _prune(self):
+        live = [w for w in self._waiters if not w[2].done()]
+        if len(live) != len(self._waiters):
+            self._waiters = live
+            heapq.heapify(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, priority=Priority.TURN, timeout=None, on_wait=None):
+        admitted_at = await self.acquire(priority, timeout=timeout, on_wait=on_wait)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(1000 * self._wait_total / self._admitted, 1) if self._admitted else 0.0,
+            "max_wait_ms": round(1000 * self._wait_max, 1),
+            "avg_hold_ms": round(1000 * self._held_total / self._released, 1) if self._released else 0.0,
+        }
+
+
+# === Upstream (concurrency + rate) ===
+class Upstream:
+    def __init__(self, name: str, concurrency: int, rate: float, burst: int, max_waiting: int, timeout: float):
+        self.name = name
+        self.limiter = PriorityLimiter(name, concurrency, max_waiting, timeout)
+        self.bucket = TokenBucket(rate, burst)
+
+    @asynccontextmanager
+    async def slot(self, priority=Priority.TURN, timeout=None):
+        # Tokens are taken first, in priority order, so a rate-limited call
+        # does not sit on a concurrency slot while it waits for a refill
+        timeout = self.limiter.timeout if timeout is None else timeout
+        started = time.monotonic()
+        if self.bucket.waiting >= self.limiter.max_waiting:
+            self.limiter.reject()
+        try:
+            await self.bucket.take(priority, deadline=started + timeout)
+        except asyncio.TimeoutError:
+            self.limiter.reject(retry_after=max(1.0, (self.bucket.waiting + 1) / self.bucket.rate))
+        try:
+            admitted_at = await self.limiter.acquire(priority, timeout=timeout, queued_since=started)
+        except BaseException:
+            # Rejected or cancelled before admission: the call never happens
+            await self.bucket.give_back()
+            raise
+        try:
+            yield
+        finally:
+            self.limiter.release(admitted_at)
+
+    def stats(self):
+        stats = self.limiter.stats()
+        return {**stats, "waiting": stats["waiting"] + self.bucket.waiting, "rate": self.bucket.stats()}
+
+
+def _upstream_from_env(name, concurrency, rate, burst, timeout):
+    prefix = name.upper()
+    concurrency = _env_int(f"{prefix}_MAX_CONCURRENCY", concurrency)
+    return Upstream(
+        name,
+        concurrency=concurrency,
+        rate=_env_float(f"{prefix}_RATE_PER_SEC", rate),
+        burst=_env_int(f"{prefix}_RATE_BURST", burst),
+        max_waiting=_env_int(f"{prefix}_MAX_WAITING", concurrency * 4),
+        timeout=_env_float(f"{prefix}_QUEUE_TIMEOUT", timeout),
+    )
+
+
+# === Turn Budget ===
+class TurnBudget:
+    """
+    Queueing time one conversational turn may still spend across its
+    upstream calls. Only time spent waiting for a slot is drawn down, so a
+    slow upstream call never eats into the budget of later stages.
+    """
+
+    def __init__(self, seconds: float):
+        self.remaining = seconds
+
+    def spend(self, seconds: float):
+        self.remaining = max(0.0, self.remaining - seconds)
+
+
+# === Governor ===
+class Governor:
+    """
+    Process-wide admission control: a cap on concurrent voice sessions plus
+    one concurrency/rate limit per upstream API (stt, llm, tts).
+    """
+
+    def __init__(self):
+        max_sessions = _env_int("MAX_SESSIONS", 20)
+        self.sessions = PriorityLimiter(
+            "sessions",
+            capacity=max_sessions,
+            max_waiting=_env_int("MAX_QUEUED_SESSIONS", max_sessions),
+            timeout=_env_float("SESSION_QUEUE_TIMEOUT", 60),
+            # Sessions are held for minutes, so never suggest an early retry
+            # before any have finished to measure from
+            retry_floor=_env_float("SESSION_RETRY_AFTER", 30),
+        )
+        # Total time one conversational turn may spend queueing across all
+        # of its upstream calls, see TurnBudget
+        self.turn_timeout = _env_float("TURN_TIMEOUT", 10)
+        self.upstreams = {
+            "stt": _upstream_from_env("stt", concurrency=8, rate=0, burst=8, timeout=15),
+            "llm": _upstream_from_env("llm", concurrency=16, rate=0, burst=16, timeout=20),
+            "tts": _upstream_from_env("tts", concurrency=8, rate=0, burst=8, timeout=15),
+        }
+
+    def upstream(self, name: str) -> Upstream:
+        return self.upstreams[name]
+
+    def turn_budget(self):
+        return TurnBudget(self.turn_timeout)
+
+    @asynccontextmanager
+    async def slot(self, name: str, priority=Priority.TURN, budget=None):
+        """
+        Upstream slot that queues for at most what is left of `budget` (or
+        the upstream timeout, if sooner) and charges the wait to it.
+        """
+        upstream = self.upstreams[name]
+        timeout = None
+        if budget is not None:
+            timeout = min(upstream.limiter.timeout, budget.remaining)
+        started = time.monotonic()
+        async with upstream.slot(priority, timeout=timeout):
+            if budget is not None:
+                budget.spend(time.monotonic() - started)
+            yield
+
+    def stats(self):
+        return {
+            "sessions": self.sessions.stats(),
+            "upstreams": {name: up.stats() for name, up in self.upstreams.items()},
+        }
+
+
+governor = Governor()
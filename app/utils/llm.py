@@ -3,6 +3,8 @@ import json
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
+import logging
+from app.utils.concurrency import governor, Priority, Saturated
 from app.utils.tools import (
     get_item_price,
     get_item_details,
@@ -18,6 +20,8 @@ from app.utils.tools import (
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # === OpenAI/Groq Configuration ===
 client = AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
@@ -113,8 +117,11 @@ function_map = {
 
 }
 
+# Tools that change the saved order; their results are user-facing text
+ORDER_TOOLS = {"add_item_to_order", "remove_item_from_order"}
+
 # === Main Handler ===
-async def ask_llm(user_input: str, order_id: str) -> dict:
+async def ask_llm(user_input: str, order_id: str, priority=Priority.TURN, budget=None) -> dict:
     messages = [
         {"role": "system", "content": f"""
 You are OrderBot, a restaurant ordering assistant for Order ID: {order_id}. Your job is to help customers place and review their food orders using the provided tools. You should always confirm additions immediately and avoid repeating already confirmed orders unless asked.
@@ -145,12 +152,13 @@ Remember: always use the tools to **read or modify** the order. Do not assume or
     ]
 
     # 1. Ask model to see if it wants to use a function
-    initial = await client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        functions=functions,
-        function_call="auto"
-    )
+    async with governor.slot("llm", priority, budget=budget):
+        initial = await client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            functions=functions,
+            function_call="auto"
+        )
 
     choice = initial.choices[0].message
 
@@ -173,12 +181,20 @@ Remember: always use the tools to **read or modify** the order. Do not assume or
         }})
         messages.append({"role": "function", "name": fn_name, "content": str(result)})
 
-        followup = await client.chat.completions.create(
-            model=MODEL,
-            messages=messages
-        )
-
-        final_response = followup.choices[0].message.content
+        try:
+            async with governor.slot("llm", priority, budget=budget):
+                followup = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages
+                )
+            final_response = followup.choices[0].message.content
+        except Saturated as e:
+            # Read-only tools can simply be retried by the client, but a
+            # retry after an order change would apply it twice
+            if fn_name not in ORDER_TOOLS:
+                raise
+            logger.warning(f"Follow-up LLM call skipped for order {order_id}: {e}")
+            final_response = result
     else:
         final_response = choice.content
 
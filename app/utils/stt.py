@@ -1,10 +1,13 @@
 # from elevenlabs.client import ElevenLabs
 import os
+import asyncio
 import tempfile
 import soundfile as sf
 from elevenlabs import ElevenLabs
 from dotenv import load_dotenv
 
+from app.utils.concurrency import governor, Priority
+
 load_dotenv()
 client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
 
@@ -15,3 +18,9 @@ def transcribe_audio(audio_np, sample_rate):
     with open(tmp_path, "rb") as f:
         response = client.speech_to_text.convert(file=f, model_id="scribe_v1", language_code="en")
     return response.text.strip() if response and hasattr(response, 'text') else ""
+
+
+async def transcribe_audio_async(audio_np, sample_rate, priority=Priority.TURN, budget=None):
+    # Blocking SDK call runs off the event loop, inside the shared STT limits
+    async with governor.slot("stt", priority, budget=budget):
+        return await asyncio.to_thread(transcribe_audio, audio_np, sample_rate)
@@ -3,6 +3,8 @@ import logging
 import numpy as np
 import soundfile as sf
 
+from app.utils.concurrency import governor, Priority
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,7 +14,7 @@ VOICE_ID = os.getenv("VOICE_ID", "9BWtsMINqrJLrRacOk9x")
 MODEL_ID = os.getenv("MODEL_ID", "eleven_turbo_v2")
 
 
-async def speak_text_stream(text: str) -> str:
+async def speak_text_stream(text: str, priority=Priority.TURN, budget=None) -> str:
     if not ELEVENLABS_API_KEY:
         logger.error("ElevenLabs API key is missing.")
         return ""
@@ -25,46 +27,48 @@ async def speak_text_stream(text: str) -> str:
 
     audio_chunks = b""
 
-    try:
-        async with websockets.connect(uri) as websocket:
-            await websocket.send(json.dumps({
-                "text": " ",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.8
-                },
-                "xi_api_key": ELEVENLABS_API_KEY,
-            }))
-
-            await websocket.send(json.dumps({
-                "text": text,
-                "try_trigger_generation": True
-            }))
-
-            await websocket.send(json.dumps({"text": ""}))
-
-            logger.info("Receiving audio stream...")
-            while True:
-                try:
-                    message_str = await websocket.recv()
-                    message = json.loads(message_str)
-
-                    if "audio" in message and message["audio"]:
-                        audio_chunks += base64.b64decode(message["audio"])
-                    elif message.get("isFinal"):
-                        logger.info("Received final message marker.")
-                        break
-                    elif message.get("error"):
-                        logger.error(f"Error from ElevenLabs: {message['error']}")
-                        break
+    # Saturated propagates so the caller can tell the client to back off
+    async with governor.slot("tts", priority, budget=budget):
+        try:
+            async with websockets.connect(uri) as websocket:
+                await websocket.send(json.dumps({
+                    "text": " ",
+                    "voice_settings": {
+                        "stability": 0.5,
+                        "similarity_boost": 0.8
+                    },
+                    "xi_api_key": ELEVENLABS_API_KEY,
+                }))
 
-                except Exception as e:
-                    logger.error(f"WebSocket error: {e}", exc_info=True)
-                    break
+                await websocket.send(json.dumps({
+                    "text": text,
+                    "try_trigger_generation": True
+                }))
 
-    except Exception as e:
-        logger.error(f"Connection error: {e}", exc_info=True)
-        return ""
+                await websocket.send(json.dumps({"text": ""}))
+
+                logger.info("Receiving audio stream...")
+                while True:
+                    try:
+                        message_str = await websocket.recv()
+                        message = json.loads(message_str)
+
+                        if "audio" in message and message["audio"]:
+                            audio_chunks += base64.b64decode(message["audio"])
+                        elif message.get("isFinal"):
+                            logger.info("Received final message marker.")
+                            break
+                        elif message.get("error"):
+                            logger.error(f"Error from ElevenLabs: {message['error']}")
+                            break
+
+                    except Exception as e:
+                        logger.error(f"WebSocket error: {e}", exc_info=True)
+                        break
+
+        except Exception as e:
+            logger.error(f"Connection error: {e}", exc_info=True)
+            return ""
 
     if not audio_chunks:
         logger.warning("No audio received from ElevenLabs.")
@@ -0,0 +1,257 @@
+"""
+Synthetic load test for app/utils/concurrency.py.
+
+STT, LLM and TTS are replaced by sleeps, so this needs no API keys or
+network access. The script first runs a few checks on the limiters,
+then drives many fake /ws/converse sessions through the governor and
+prints admission counts, latencies and /api/capacity style stats.
+
+    python scripts/loadtest_concurrency.py --sessions 40 --max-sessions 10 --max-queued 5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Seconds each fake upstream call takes
+STT_TIME = 0.05
+LLM_TIME = 0.2
+TTS_TIME = 0.1
+
+
+# === PriorityLimiter checks ===
+async def check_priority_order():
+    from app.utils.concurrency import PriorityLimiter, Priority
+
+    limiter = PriorityLimiter("check", capacity=1, max_waiting=10, timeout=5)
+    held = await limiter.acquire()
+    served = []
+
+    async def waiter(tag, priority):
+        admitted_at = await limiter.acquire(priority)
+        served.append(tag)
+        limiter.release(admitted_at)
+
+    greeting = asyncio.create_task(waiter("greeting", Priority.GREETING))
+    await asyncio.sleep(0)
+    turn = asyncio.create_task(waiter("turn", Priority.TURN))
+    await asyncio.sleep(0)
+    limiter.release(held)
+    await asyncio.gather(greeting, turn)
+    assert served == ["turn", "greeting"], served
+    assert limiter.in_flight == 0
+
+
+async def check_no_leak_on_cancel_or_timeout():
+    from app.utils.concurrency import PriorityLimiter, Saturated
+
+    limiter = PriorityLimiter("check", capacity=1, max_waiting=10, timeout=5)
+    held = await limiter.acquire()
+
+    cancelled = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    try:
+        await limiter.acquire(timeout=0.05)
+        raise AssertionError("expected Saturated")
+    except Saturated:
+        pass
+    await asyncio.gather(cancelled, return_exceptions=True)
+
+    limiter.release(held)
+    assert limiter.in_flight == 0 and limiter.waiting == 0, limiter.stats()
+    assert limiter.stats()["rejected"] == 1
+
+
+async def check_queue_full_rejects_fast():
+    from app.utils.concurrency import PriorityLimiter, Saturated
+
+    limiter = PriorityLimiter("check", capacity=1, max_waiting=1, timeout=5)
+    held = await limiter.acquire()
+    queued = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    started = time.monotonic()
+    try:
+        await limiter.acquire()
+        raise AssertionError("expected Saturated")
+    except Saturated:
+        pass
+    assert time.monotonic() - started < 0.05
+
+    limiter.release(held)
+    limiter.release(await queued)
+    assert limiter.in_flight == 0
+
+
+async def check_token_returned_on_cancel():
+    from app.utils.concurrency import Upstream
+
+    upstream = Upstream("check", concurrency=1, rate=0.2, burst=2, max_waiting=10, timeout=5)
+
+    async def hold(release):
+        async with upstream.slot():
+            await release.wait()
+
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(release))
+    await asyncio.sleep(0)
+    # Takes the last token, then queues for the busy concurrency slot
+    queued = asyncio.create_task(upstream.slot().__aenter__())
+    await asyncio.sleep(0.01)
+    # No tokens left: this waits at the head of the bucket for a 5s refill
+    started = time.monotonic()
+    refill_waiter = asyncio.create_task(upstream.bucket.take())
+    await asyncio.sleep(0.01)
+
+    queued.cancel()
+    await asyncio.gather(queued, return_exceptions=True)
+    await asyncio.wait_for(refill_waiter, 1)
+    assert time.monotonic() - started < 0.5
+
+    release.set()
+    await holder
+    assert upstream.limiter.in_flight == 0
+
+
+async def check_turn_budget_counts_only_queueing():
+    from app.utils.concurrency import Upstream, TurnBudget, governor
+
+    # Private upstream so the checks do not show up in the load-test stats
+    governor.upstreams["check"] = Upstream("check", concurrency=1, rate=0, burst=1, max_waiting=10, timeout=5)
+    try:
+        budget = TurnBudget(0.3)
+        # A call slower than the whole budget, admitted without queueing
+        async with governor.slot("check", budget=budget):
+            await asyncio.sleep(0.4)
+        assert budget.remaining > 0.29, budget.remaining
+
+        async def hold():
+            async with governor.slot("check"):
+                await asyncio.sleep(0.2)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        async with governor.slot("check", budget=budget):
+            pass
+        await holder
+        assert 0.05 < budget.remaining < 0.15, budget.remaining
+    finally:
+        del governor.upstreams["check"]
+
+
+async def run_checks():
+    checks = (
+        check_priority_order,
+        check_no_leak_on_cancel_or_timeout,
+        check_queue_full_rejects_fast,
+        check_token_returned_on_cancel,
+        check_turn_budget_counts_only_queueing,
+    )
+    for check in checks:
+        await check()
+        print(f"ok  {check.__name__}")
+
+
+# === Synthetic load ===
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run_load(args):
+    from app.utils.concurrency import governor, Priority, Saturated
+
+    results = {"completed": 0, "rejected": 0, "queue_updates": 0, "busy_turns": 0, "tts_skipped": 0}
+    greeting_latency = []
+    turn_latency = []
+
+    async def fake_call(name, seconds, priority=Priority.TURN, budget=None):
+        async with governor.slot(name, priority, budget=budget):
+            await asyncio.sleep(seconds)
+
+    async def session():
+        async def report_position(position):
+            results["queue_updates"] += 1
+
+        try:
+            admitted_at = await governor.sessions.acquire(on_wait=report_position, update_interval=0.2)
+        except Saturated:
+            results["rejected"] += 1
+            return
+        try:
+            started = time.monotonic()
+            await fake_call("tts", TTS_TIME, Priority.GREETING)
+            greeting_latency.append(time.monotonic() - started)
+
+            for _ in range(args.turns):
+                await asyncio.sleep(args.think_time)
+                started = time.monotonic()
+                budget = governor.turn_budget()
+                try:
+                    await fake_call("stt", STT_TIME, budget=budget)
+                    await fake_call("llm", LLM_TIME, budget=budget)
+                except Saturated:
+                    results["busy_turns"] += 1
+                    continue
+                try:
+                    await fake_call("tts", TTS_TIME, budget=budget)
+                except Saturated:
+                    results["tts_skipped"] += 1
+                turn_latency.append(time.monotonic() - started)
+            results["completed"] += 1
+        finally:
+            governor.sessions.release(admitted_at)
+
+    started = time.monotonic()
+    await asyncio.gather(*(session() for _ in range(args.sessions)))
+    elapsed = time.monotonic() - started
+
+    print(json.dumps(results))
+    for label, values in (("greeting", greeting_latency), ("turn", turn_latency)):
+        print(
+            f"{label:<9} n={len(values):<4} p50={percentile(values, 0.5):.2f}s "
+            f"p95={percentile(values, 0.95):.2f}s max={max(values, default=0):.2f}s"
+        )
+    print(f"elapsed   {elapsed:.2f}s")
+    print(json.dumps(governor.stats(), indent=2))
+
+    leaked = [name for name, up in governor.upstreams.items() if up.limiter.in_flight]
+    assert governor.sessions.in_flight == 0 and not leaked, f"slots leaked: sessions={governor.sessions.in_flight} {leaked}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40, help="concurrent sessions to open")
+    parser.add_argument("--max-sessions", type=int, default=10)
+    parser.add_argument("--max-queued", type=int, default=5)
+    parser.add_argument("--session-timeout", type=float, default=3, help="seconds a session may wait in line")
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds of user time before each turn")
+    parser.add_argument("--llm-rate", type=float, default=20, help="LLM calls per second, 0 for unlimited")
+    args = parser.parse_args()
+
+    # The governor reads its settings on import, so set them first
+    os.environ.update({
+        "MAX_SESSIONS": str(args.max_sessions),
+        "MAX_QUEUED_SESSIONS": str(args.max_queued),
+        "SESSION_QUEUE_TIMEOUT": str(args.session_timeout),
+        "STT_MAX_CONCURRENCY": "3",
+        "LLM_MAX_CONCURRENCY": "4",
+        "LLM_RATE_PER_SEC": str(args.llm_rate),
+        "LLM_RATE_BURST": "4",
+        "TTS_MAX_CONCURRENCY": "3",
+    })
+
+    asyncio.run(run_checks())
+    asyncio.run(run_load(args))
+
+
+if __name__ == "__main__":
+    main()